@@ -5,27 +5,37 @@ A super simple FastAPI application that allows students to view and sign up
 for extracurricular activities at Mergington High School.
 """
 
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response
 import os
 from pathlib import Path
 
+from . import db
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Initialize database and seed initial activities on startup
+    await db.init_db()
+    await db.seed_initial_activities_if_needed()
+    await db.load_activity_members()
+    db.invalidate_activities_cache()
+    yield
+    await db.engine.dispose()
+
+
 app = FastAPI(title="Mergington High School API",
-              description="API for viewing and signing up for extracurricular activities")
+              description="API for viewing and signing up for extracurricular activities",
+              lifespan=lifespan)
 
 # Mount the static files directory
 current_dir = Path(__file__).parent
 app.mount("/static", StaticFiles(directory=os.path.join(Path(__file__).parent,
           "static")), name="static")
 
-from . import db
-from sqlmodel import select
-
-# Initialize database and seed initial activities on startup
-db.init_db()
-db.seed_initial_activities_if_needed()
-
 
 @app.get("/")
 def root():
@@ -33,76 +43,72 @@ def root():
 
 
 @app.get("/activities")
-def get_activities():
-    return db.activities_as_dict()
+async def get_activities():
+    return Response(content=await db.activities_json(), media_type="application/json")
 
 
 @app.post("/activities/{activity_name}/signup")
-def signup_for_activity(activity_name: str, email: str):
+async def signup_for_activity(
+    activity_name: str, email: str, session: AsyncSession = Depends(db.get_session_dep)
+):
     """Sign up a student for an activity"""
-    with db.get_session() as session:
-        # Find activity by name
-        activity = session.exec(
-            select(db.Activity).where(db.Activity.name == activity_name)
-        ).first()
-        if activity is None:
-            raise HTTPException(status_code=404, detail="Activity not found")
+    # Find activity by name
+    try:
+        activity_id, max_participants = db.ACTIVITY_INDEX[activity_name]
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Activity not found")
 
+    async with session.begin():
         # Ensure user exists (create if missing)
-        user = session.exec(select(db.User).where(db.User.email == email)).first()
-        if user is None:
-            user = db.User(email=email)
-            session.add(user)
-            session.commit()
-            session.refresh(user)
-
-        # Check if already signed up
-        existing = session.exec(
-            select(db.Participation).where(
-                db.Participation.activity_id == activity.id,
-                db.Participation.user_id == user.id,
-            )
-        ).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="Student is already signed up")
-
-        # Check capacity
-        participants = session.exec(
-            select(db.Participation).where(db.Participation.activity_id == activity.id)
-        ).all()
-        if activity.max_participants and len(participants) >= activity.max_participants:
+        user_id = (
+            await session.exec(db.STMT_UPSERT_USER, params={"email": email})
+        ).scalar_one()
+
+        # A set bit is only a hint; confirm against the database before
+        # turning the student away.
+        if db.is_member(activity_id, user_id):
+            if await db.participation_exists(session, activity_id, user_id):
+                raise HTTPException(status_code=400, detail="Student is already signed up")
+            db.remove_member(activity_id, user_id)
+
+        # Add participation if there is room
+        result = await session.exec(
+            db.STMT_INSERT_PARTICIPATION,
+            params={
+                "activity_id": activity_id,
+                "user_id": user_id,
+                "max_participants": max_participants,
+            },
+        )
+        if result.rowcount == 0:
+            if await db.participation_exists(session, activity_id, user_id):
+                db.add_member(activity_id, user_id)
+                raise HTTPException(status_code=400, detail="Student is already signed up")
             raise HTTPException(status_code=400, detail="Activity is full")
-
-        # Add participation
-        p = db.Participation(activity_id=activity.id, user_id=user.id)
-        session.add(p)
-        session.commit()
+    db.add_member(activity_id, user_id)
+    db.invalidate_activities_cache()
     return {"message": f"Signed up {email} for {activity_name}"}
 
 
 @app.delete("/activities/{activity_name}/unregister")
-def unregister_from_activity(activity_name: str, email: str):
+async def unregister_from_activity(
+    activity_name: str, email: str, session: AsyncSession = Depends(db.get_session_dep)
+):
     """Unregister a student from an activity"""
-    with db.get_session() as session:
-        activity = session.exec(
-            select(db.Activity).where(db.Activity.name == activity_name)
-        ).first()
-        if activity is None:
-            raise HTTPException(status_code=404, detail="Activity not found")
-
-        user = session.exec(select(db.User).where(db.User.email == email)).first()
-        if user is None:
-            raise HTTPException(status_code=400, detail="Student is not signed up for this activity")
-
-        participation = session.exec(
-            select(db.Participation).where(
-                db.Participation.activity_id == activity.id,
-                db.Participation.user_id == user.id,
-            )
-        ).first()
-        if participation is None:
-            raise HTTPException(status_code=400, detail="Student is not signed up for this activity")
-
-        session.delete(participation)
-        session.commit()
+    try:
+        activity_id, _ = db.ACTIVITY_INDEX[activity_name]
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Activity not found")
+
+    user_id = (
+        await session.exec(
+            db.STMT_DELETE_PARTICIPATION, params={"activity_id": activity_id, "email": email}
+        )
+    ).scalar()
+    if user_id is None:
+        raise HTTPException(status_code=400, detail="Student is not signed up for this activity")
+
+    await session.commit()
+    db.remove_member(activity_id, user_id)
+    db.invalidate_activities_cache()
     return {"message": f"Unregistered {email} from {activity_name}"}
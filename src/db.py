@@ -1,6 +1,35 @@
-from typing import Optional, List, Dict
-from sqlmodel import SQLModel, Field, Session, create_engine, select
+from typing import AsyncIterator, Optional, List, Dict, Tuple
+from sqlmodel import SQLModel, Field, Relationship, delete, func, or_, select, text
+from sqlmodel.ext.asyncio.session import AsyncSession
 from pathlib import Path
+import os
+import threading
+import time
+import orjson
+from sqlalchemy import Index, bindparam, event, exists, literal
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import raiseload, selectinload
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+class User(SQLModel, table=True):
+    __table_args__ = (Index("ix_user_email", "email", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    email: str
+
+
+class Participation(SQLModel, table=True):
+    __table_args__ = (
+        Index("uq_part_act_user", "activity_id", "user_id", unique=True),
+        Index("ix_part_activity", "activity_id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    activity_id: int = Field(foreign_key="activity.id")
+    user_id: int = Field(foreign_key="user.id")
 
 
 class Activity(SQLModel, table=True):
@@ -10,37 +39,143 @@ class Activity(SQLModel, table=True):
     schedule: Optional[str] = None
     max_participants: int = 0
 
+    # Loaded for all selected activities with one extra IN query, in signup
+    # order
+    participants: List[User] = Relationship(
+        link_model=Participation,
+        sa_relationship_kwargs={"lazy": "selectin", "order_by": "Participation.id"},
+    )
 
-class User(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
-    email: str
 
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """Tune every new SQLite connection.
 
-class Participation(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
-    activity_id: int = Field(foreign_key="activity.id")
-    user_id: int = Field(foreign_key="user.id")
+    WAL lets readers proceed while a writer commits, and NORMAL sync drops
+    the fsync on each commit (still durable across application crashes).
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def configure_database(path: Path) -> None:
+    """Point the engine and session factory at the SQLite file at ``path``."""
+    global DB_PATH, DATABASE_URL, engine, SessionLocal
+    DB_PATH = Path(path)
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    DATABASE_URL = f"sqlite+aiosqlite:///{DB_PATH.as_posix()}"
+
+    # Connections are pooled and reused across requests, which keeps
+    # SQLite's per-connection page cache warm. aiosqlite runs each connection
+    # in its own worker thread, hence check_same_thread=False.
+    engine = create_async_engine(
+        DATABASE_URL,
+        echo=False,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=5,
+        max_overflow=10,
+        pool_pre_ping=True,
+        connect_args={"check_same_thread": False},
+    )
+    event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+    SessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+# DB file next to the app, unless ACTIVITIES_DB_PATH says otherwise
+configure_database(
+    Path(
+        os.environ.get(
+            "ACTIVITIES_DB_PATH", Path(__file__).parent.parent / "data" / "activities.db"
+        )
+    )
+)
+
+
+def _create_indexes(conn) -> None:
+    # create_all skips tables that already exist, indexes included, so
+    # databases created before an index was declared get it added here.
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(conn, checkfirst=True)
+            except IntegrityError as exc:
+                # The signup upserts rely on ON CONFLICT against these
+                # unique indexes; without them every signup would fail.
+                raise RuntimeError(
+                    f"Cannot create unique index {index.name} on {table.name}: "
+                    "the table contains duplicate rows. Remove the duplicates "
+                    "and restart."
+                ) from exc
+
+
+async def init_db() -> None:
+    """Create database tables and any indexes missing from existing ones."""
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(_create_indexes)
 
 
-# DB file next to the app
-DB_PATH = Path(__file__).parent.parent / "data" / "activities.db"
-DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-DATABASE_URL = f"sqlite:///{DB_PATH.as_posix()}"
+def get_session() -> AsyncSession:
+    return SessionLocal()
 
-# Create engine
-engine = create_engine(DATABASE_URL, echo=False)
 
+async def get_session_dep() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency providing one session per request."""
+    async with SessionLocal() as session:
+        yield session
 
-def init_db() -> None:
-    """Create database tables."""
-    SQLModel.metadata.create_all(engine)
 
+# Statements run on every request, built once at import time and executed
+# with bound parameters instead of being reconstructed per call.
+STMT_UPSERT_USER = text(
+    "INSERT INTO user (email) VALUES (:email) "
+    "ON CONFLICT(email) DO UPDATE SET email = email RETURNING id"
+)
 
-def get_session() -> Session:
-    return Session(engine)
+# Inserts only while there is room; an existing signup is skipped via the
+# unique index on (activity_id, user_id). Either way no row is inserted, so
+# callers tell the two apart with STMT_PARTICIPATION_EXISTS. Built on the
+# Table because ORM-enabled INSERTs treat parameters as rows to bulk insert.
+STMT_INSERT_PARTICIPATION = sqlite_insert(Participation.__table__).from_select(
+    [Participation.activity_id, Participation.user_id],
+    select(bindparam("activity_id"), bindparam("user_id")).where(
+        or_(
+            bindparam("max_participants") == 0,
+            select(func.count())
+            .select_from(Participation)
+            .where(Participation.activity_id == bindparam("activity_id"))
+            .scalar_subquery()
+            < bindparam("max_participants"),
+        )
+    ),
+).on_conflict_do_nothing()
 
+STMT_PARTICIPATION_EXISTS = select(
+    exists().where(
+        Participation.activity_id == bindparam("activity_id"),
+        Participation.user_id == bindparam("user_id"),
+    )
+)
 
-def seed_initial_activities_if_needed() -> None:
+STMT_DELETE_PARTICIPATION = delete(Participation).where(
+    Participation.activity_id == bindparam("activity_id"),
+    Participation.user_id.in_(select(User.id).where(User.email == bindparam("email"))),
+).returning(Participation.user_id)
+
+# Relationships needed for the listing are loaded explicitly; any other
+# relationship access raises instead of silently issuing a query per row.
+_STMT_ACTIVITIES = (
+    select(Activity)
+    .options(selectinload(Activity.participants), raiseload("*"))
+    .order_by(Activity.id)
+)
+
+
+async def seed_initial_activities_if_needed() -> None:
     """Seed the database with some initial activities if empty.
 
     This keeps the first-run behaviour predictable and mirrors the
@@ -103,34 +238,132 @@ def seed_initial_activities_if_needed() -> None:
         },
     ]
 
-    with get_session() as session:
-        count = session.exec(select(Activity)).first()
+    async with get_session() as session:
+        existing = (
+            await session.exec(select(literal(1)).select_from(Activity).limit(1))
+        ).first()
         # If no Activity rows exist, add initial set
-        if count is None:
-            for a in initial:
-                activity = Activity(**a)
-                session.add(activity)
-            session.commit()
+        if existing is None:
+            await session.run_sync(lambda s: s.bulk_insert_mappings(Activity, initial))
+            await session.commit()
+    await load_activity_index()
+
+
+# Activity name -> (id, max_participants). Activities are static after
+# seeding, so handlers resolve names here instead of querying; call
+# load_activity_index() again after changing the activity table.
+ACTIVITY_INDEX: Dict[str, Tuple[int, int]] = {}
+
+
+async def load_activity_index() -> None:
+    """Rebuild ACTIVITY_INDEX from the activity table."""
+    async with get_session() as session:
+        rows = await session.exec(
+            select(Activity.name, Activity.id, Activity.max_participants)
+        )
+        index = {
+            name: (activity_id, max_participants)
+            for name, activity_id, max_participants in rows
+        }
+    ACTIVITY_INDEX.clear()
+    ACTIVITY_INDEX.update(index)
+
+
+# Participant user ids per activity id, one bit per user id. The database
+# stays the source of truth: other processes may change participation, so a
+# set bit is only a hint that signup confirms with participation_exists()
+# before rejecting a request. Capacity is left to the guarded INSERT.
+_activity_members: Dict[int, int] = {}
+
+
+async def load_activity_members() -> None:
+    """Rebuild the membership bitsets from the participation table."""
+    members: Dict[int, int] = {}
+    async with get_session() as session:
+        rows = await session.exec(select(Participation.activity_id, Participation.user_id))
+        for activity_id, user_id in rows:
+            members[activity_id] = members.get(activity_id, 0) | (1 << user_id)
+    _activity_members.clear()
+    _activity_members.update(members)
+
+
+async def participation_exists(session: AsyncSession, activity_id: int, user_id: int) -> bool:
+    """Index-only EXISTS probe for a single signup."""
+    return (
+        await session.exec(
+            STMT_PARTICIPATION_EXISTS,
+            params={"activity_id": activity_id, "user_id": user_id},
+        )
+    ).one()
+
+
+def is_member(activity_id: int, user_id: int) -> bool:
+    return bool(_activity_members.get(activity_id, 0) & (1 << user_id))
 
 
-def activities_as_dict() -> Dict[str, dict]:
+def add_member(activity_id: int, user_id: int) -> None:
+    _activity_members[activity_id] = _activity_members.get(activity_id, 0) | (1 << user_id)
+
+
+def remove_member(activity_id: int, user_id: int) -> None:
+    _activity_members[activity_id] = _activity_members.get(activity_id, 0) & ~(1 << user_id)
+
+
+# Cached result of activities_as_dict, plus its JSON encoding for the
+# /activities endpoint. "v" is bumped whenever participation changes in this
+# process; a rebuild is only stored if no invalidation happened meanwhile.
+# Entries also expire after ACTIVITIES_CACHE_TTL seconds so changes made by
+# other processes show up without a local write.
+ACTIVITIES_CACHE_TTL = 2.0
+_cache: Dict[str, object] = {"v": 0, "data": None, "json": None, "built_at": 0.0}
+_cache_lock = threading.Lock()
+
+
+def invalidate_activities_cache() -> None:
+    """Drop the cached activities so the next read rebuilds them."""
+    with _cache_lock:
+        _cache["v"] += 1
+        _cache["data"] = None
+        _cache["json"] = None
+
+
+async def _cached_activities() -> Tuple[Dict[str, dict], bytes]:
+    with _cache_lock:
+        fresh = time.monotonic() - _cache["built_at"] < ACTIVITIES_CACHE_TTL
+        if _cache["data"] is not None and fresh:
+            return _cache["data"], _cache["json"]
+        version = _cache["v"]
+    built_at = time.monotonic()
+    data = await _load_activities_dict()
+    encoded = orjson.dumps(data)
+    with _cache_lock:
+        if _cache["v"] == version:
+            _cache["data"] = data
+            _cache["json"] = encoded
+            _cache["built_at"] = built_at
+    return data, encoded
+
+
+async def activities_as_dict() -> Dict[str, dict]:
     """Return activities shaped like the old in-memory dict for compatibility."""
+    data, _ = await _cached_activities()
+    return data
+
+
+async def activities_json() -> bytes:
+    """Return activities_as_dict() already encoded as JSON."""
+    _, encoded = await _cached_activities()
+    return encoded
+
+
+async def _load_activities_dict() -> Dict[str, dict]:
     out: Dict[str, dict] = {}
-    with get_session() as session:
-        activities = session.exec(select(Activity)).all()
-        for activity in activities:
-            # collect participants emails
-            parts = (
-                session.exec(
-                    select(User.email)
-                    .join(Participation, Participation.user_id == User.id)
-                    .where(Participation.activity_id == activity.id)
-                ).all()
-            )
+    async with get_session() as session:
+        for activity in (await session.exec(_STMT_ACTIVITIES)).all():
             out[activity.name] = {
                 "description": activity.description,
                 "schedule": activity.schedule,
                 "max_participants": activity.max_participants,
-                "participants": parts,
+                "participants": [user.email for user in activity.participants],
             }
     return out
@@ -0,0 +1,156 @@
+from contextlib import contextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from src import db
+from src.app import app
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # Each test gets its own database file; entering the client runs the
+    # lifespan, which creates and seeds it.
+    monkeypatch.setattr(db, "DB_PATH", db.DB_PATH)
+    monkeypatch.setattr(db, "DATABASE_URL", db.DATABASE_URL)
+    monkeypatch.setattr(db, "engine", db.engine)
+    monkeypatch.setattr(db, "SessionLocal", db.SessionLocal)
+    db.configure_database(tmp_path / "activities.db")
+    with TestClient(app) as client:
+        yield client
+
+
+@contextmanager
+def recorded_statements():
+    """Collect the SQL sent to the database inside the block."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine.sync_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine.sync_engine, "before_cursor_execute", record)
+
+
+def test_get_activities(client):
+    response = client.get("/activities")
+    assert response.status_code == 200
+    activities = response.json()
+    assert "Chess Club" in activities
+    for details in activities.values():
+        assert set(details) == {"description", "schedule", "max_participants", "participants"}
+        assert isinstance(details["participants"], list)
+
+
+def test_cold_listing_runs_two_selects(client):
+    db.invalidate_activities_cache()
+    with recorded_statements() as statements:
+        assert client.get("/activities").status_code == 200
+
+    # One SELECT for the activities, one batched IN query for participants.
+    selects = [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+    assert len(selects) == 2, statements
+
+
+def test_listing_query_loads_signed_up_participants(client):
+    email = "listed@mergington.edu"
+    assert client.post("/activities/Chess Club/signup", params={"email": email}).status_code == 200
+
+    async def load():
+        async with db.get_session() as session:
+            activities = (await session.exec(db._STMT_ACTIVITIES)).all()
+            return {a.name: [user.email for user in a.participants] for a in activities}
+
+    loaded = client.portal.call(load)
+    assert loaded["Chess Club"] == [email]
+    assert loaded["Math Club"] == []
+
+
+def test_participants_keep_signup_order(client):
+    emails = ["order-b@mergington.edu", "order-c@mergington.edu", "order-a@mergington.edu"]
+    for email in emails:
+        response = client.post("/activities/Art Club/signup", params={"email": email})
+        assert response.status_code == 200
+    # Re-signing up moves a student to the end, as in the old listing.
+    client.delete("/activities/Art Club/unregister", params={"email": emails[0]})
+    client.post("/activities/Art Club/signup", params={"email": emails[0]})
+
+    participants = client.get("/activities").json()["Art Club"]["participants"]
+    assert participants == emails[1:] + emails[:1]
+
+
+def test_participant_email_containing_comma(client):
+    email = "comma,student@mergington.edu"
+    assert client.post("/activities/Drama Club/signup", params={"email": email}).status_code == 200
+    assert client.get("/activities").json()["Drama Club"]["participants"] == [email]
+
+
+def test_stale_full_bitset_does_not_reject_signup(client):
+    email = "stale@mergington.edu"
+    activity_id, max_participants = db.ACTIVITY_INDEX["Chess Club"]
+    # Pretend another process filled the activity, then freed the spots.
+    db._activity_members[activity_id] = ((1 << max_participants) - 1) << 1000
+    response = client.post("/activities/Chess Club/signup", params={"email": email})
+    assert response.status_code == 200
+    assert client.get("/activities").json()["Chess Club"]["participants"] == [email]
+
+
+def test_stale_member_bit_does_not_reject_signup(client):
+    email = "rejoin@mergington.edu"
+    activity_id, _ = db.ACTIVITY_INDEX["Gym Class"]
+    assert client.post("/activities/Gym Class/signup", params={"email": email}).status_code == 200
+    response = client.post("/activities/Gym Class/signup", params={"email": email})
+    assert response.status_code == 400
+
+    # Remove the row behind the bitset's back, as another process would.
+    async def remove():
+        async with db.get_session() as session:
+            await session.exec(
+                db.STMT_DELETE_PARTICIPATION,
+                params={"activity_id": activity_id, "email": email},
+            )
+            await session.commit()
+
+    client.portal.call(remove)
+    response = client.post("/activities/Gym Class/signup", params={"email": email})
+    assert response.status_code == 200
+
+
+def test_full_activity_rejection_does_not_read_participants(client):
+    _, max_participants = db.ACTIVITY_INDEX["Math Club"]
+    for i in range(max_participants):
+        params = {"email": f"math{i}@mergington.edu"}
+        assert client.post("/activities/Math Club/signup", params=params).status_code == 200
+
+    with recorded_statements() as statements:
+        params = {"email": "late@mergington.edu"}
+        response = client.post("/activities/Math Club/signup", params=params)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Activity is full"
+    assert not any("SELECT participation.user_id" in s for s in statements), statements
+
+
+def test_activities_cache_expires(client, monkeypatch):
+    email = "elsewhere@mergington.edu"
+    assert client.get("/activities").json()["Art Club"]["participants"] == []
+
+    # Sign up the way another process would, without touching this cache.
+    async def signup():
+        async with db.get_session() as session:
+            user_id = (
+                await session.exec(db.STMT_UPSERT_USER, params={"email": email})
+            ).scalar_one()
+            activity_id, _ = db.ACTIVITY_INDEX["Art Club"]
+            session.add(db.Participation(activity_id=activity_id, user_id=user_id))
+            await session.commit()
+
+    client.portal.call(signup)
+    assert client.get("/activities").json()["Art Club"]["participants"] == []
+
+    monkeypatch.setattr(db, "ACTIVITIES_CACHE_TTL", 0)
+    assert client.get("/activities").json()["Art Club"]["participants"] == [email]